@@ -213,10 +213,10 @@ class NodeAgent:
         for (deployment_id, name), instance in self.proxy_manager.get_all_proxies().items():
             backend_host = instance.proxy.config.backend_host
             backend_port = instance.backend_port
-            start_time = time.time()
+            deadline = time.monotonic() + timeout
             label = f"{deployment_id}/{name}"
 
-            while time.time() - start_time < timeout:
+            while time.monotonic() < deadline:
                 try:
                     test_sock = sock.create_connection((backend_host, backend_port), timeout=1)
                     test_sock.close()
@@ -11,6 +11,18 @@ from .base_proxy import BaseProxy, ProxyConfig
 from .unified_logger import UnifiedLogger, ProtocolInfo
 
 
+# Precompiled frame layouts, shared by every request/response parse
+_MBAP_HEADER = struct.Struct(">HHHB")
+_ADDR_VALUE = struct.Struct(">HH")
+_ADDR_QTY_COUNT = struct.Struct(">HHB")
+
+
+def _unpack_registers(data: bytes, offset: int, count: int) -> list:
+    """Decode ``count`` big-endian 16-bit registers starting at ``offset``"""
+    if count <= 0:
+        return []
+    return list(struct.unpack_from(f">{count}H", data, offset))
+
 # Modbus Function Code Names
 MODBUS_FUNCTION_NAMES = {
     0x01: "Read Coils",
@@ -102,7 +114,7 @@ class ModbusProxy(BaseProxy):
         
         try:
             # Parse MBAP Header
-            trans_id, proto_id, length, unit_id = struct.unpack(">HHHB", data[:7])
+            trans_id, proto_id, length, unit_id = _MBAP_HEADER.unpack_from(data)
             
             result["modbus.transaction_id"] = trans_id
             result["modbus.protocol_id"] = proto_id
@@ -154,7 +166,7 @@ class ModbusProxy(BaseProxy):
         
         try:
             # Parse MBAP Header
-            trans_id, proto_id, length, unit_id = struct.unpack(">HHHB", data[:7])
+            trans_id, proto_id, length, unit_id = _MBAP_HEADER.unpack_from(data)
             
             result["modbus.transaction_id"] = trans_id
             result["modbus.unit_id"] = unit_id
@@ -203,25 +215,25 @@ class ModbusProxy(BaseProxy):
         
         if func_code in (0x01, 0x02, 0x03, 0x04):  # Read Coils/DI/HR/IR
             if len(data) >= 4:
-                start_addr, quantity = struct.unpack(">HH", data[:4])
+                start_addr, quantity = _ADDR_VALUE.unpack_from(data)
                 result["modbus.start_address"] = start_addr
                 result["modbus.quantity"] = quantity
                 
         elif func_code == 0x05:  # Write Single Coil
             if len(data) >= 4:
-                addr, value = struct.unpack(">HH", data[:4])
+                addr, value = _ADDR_VALUE.unpack_from(data)
                 result["modbus.address"] = addr
                 result["modbus.value"] = value == 0xFF00  # True/False
                 
         elif func_code == 0x06:  # Write Single Register
             if len(data) >= 4:
-                addr, value = struct.unpack(">HH", data[:4])
+                addr, value = _ADDR_VALUE.unpack_from(data)
                 result["modbus.address"] = addr
                 result["modbus.value"] = value
                 
         elif func_code == 0x0F:  # Write Multiple Coils
             if len(data) >= 5:
-                start_addr, quantity, byte_count = struct.unpack(">HHB", data[:5])
+                start_addr, quantity, byte_count = _ADDR_QTY_COUNT.unpack_from(data)
                 result["modbus.start_address"] = start_addr
                 result["modbus.quantity"] = quantity
                 result["modbus.byte_count"] = byte_count
@@ -230,18 +242,14 @@ class ModbusProxy(BaseProxy):
                     
         elif func_code == 0x10:  # Write Multiple Registers
             if len(data) >= 5:
-                start_addr, quantity, byte_count = struct.unpack(">HHB", data[:5])
+                start_addr, quantity, byte_count = _ADDR_QTY_COUNT.unpack_from(data)
                 result["modbus.start_address"] = start_addr
                 result["modbus.quantity"] = quantity
                 result["modbus.byte_count"] = byte_count
                 if len(data) > 5:
                     # Parse register values
-                    values = []
-                    for i in range(0, min(quantity * 2, len(data) - 5), 2):
-                        if i + 2 <= len(data) - 5:
-                            val = struct.unpack(">H", data[5+i:7+i])[0]
-                            values.append(val)
-                    result["modbus.values"] = values
+                    count = min(quantity, (len(data) - 5) // 2)
+                    result["modbus.values"] = _unpack_registers(data, 5, count)
                     
         elif func_code == 0x2B:  # Encapsulated Interface Transport (MEI)
             if len(data) >= 3 and data[0] == 0x0E:  # Read Device ID
@@ -270,22 +278,18 @@ class ModbusProxy(BaseProxy):
                 result["modbus.byte_count"] = byte_count
                 if len(data) > 1:
                     # Parse register values
-                    values = []
-                    for i in range(1, min(byte_count + 1, len(data)), 2):
-                        if i + 2 <= len(data):
-                            val = struct.unpack(">H", data[i:i+2])[0]
-                            values.append(val)
-                    result["modbus.values"] = values
+                    count = min((byte_count + 1) // 2, (len(data) - 1) // 2)
+                    result["modbus.values"] = _unpack_registers(data, 1, count)
                     
         elif func_code in (0x05, 0x06):  # Write Single Coil/Register Response (Echo)
             if len(data) >= 4:
-                addr, value = struct.unpack(">HH", data[:4])
+                addr, value = _ADDR_VALUE.unpack_from(data)
                 result["modbus.address"] = addr
                 result["modbus.value"] = value
                 
         elif func_code in (0x0F, 0x10):  # Write Multiple Response
             if len(data) >= 4:
-                start_addr, quantity = struct.unpack(">HH", data[:4])
+                start_addr, quantity = _ADDR_VALUE.unpack_from(data)
                 result["modbus.start_address"] = start_addr
                 result["modbus.quantity"] = quantity
                 
@@ -356,7 +360,7 @@ class ModbusProxy(BaseProxy):
             return header
         
         # Get length from header
-        _, _, length, _ = struct.unpack(">HHHB", header)
+        _, _, length, _ = _MBAP_HEADER.unpack(header)
         
         # Length includes Unit ID (1 byte), so remaining PDU is (length - 1) bytes
         remaining = length - 1
@@ -1,20 +1,193 @@
 import sqlite3
 import aiosqlite
-import aiofiles
+import contextlib
 import json
-from datetime import datetime
+import fast_json
+from datetime import datetime, timedelta
 import os
 import asyncio
 import time
+import collections
+import queue
+import threading
+
+# journal_mode=WAL is persisted in the DB file by _init_db_sync, but these
+# settings are per-connection and reset on every connect. synchronous=NORMAL
+# is the safe setting under WAL (a power loss can only drop the last
+# commits, never corrupt the DB) and skips the fsync FULL does on every
+# commit. The rest keep temp b-trees in RAM and map a 256 MiB window over
+# the (large) logs table. Page cache sizes are set per role in
+# _ensure_connections: the writer gets _WRITER_CACHE_KIB, the readers split
+# ServerDB.reader_cache_mib between them.
+_CONNECTION_PRAGMAS = (
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',
+)
+_WRITER_CACHE_KIB = 65536
+_MIN_READER_CACHE_KIB = 2048
+
+
+# UPDATE ... RETURNING needs SQLite 3.35+; older builds re-select the row
+# inside the same write transaction instead.
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Hot-path statements, kept as module constants so the identical SQL text
+# hits each long-lived connection's prepared-statement cache.
+_SQL_UPDATE_HEARTBEAT = (
+    'UPDATE agents SET last_heartbeat = ?, last_heartbeat_epoch = ?, status = ?, '
+    'ip = COALESCE(?, ip), name = COALESCE(?, name), runtime_status_json = ? WHERE node_id = ?'
+)
+_SQL_UPDATE_HEARTBEAT_RETURNING = _SQL_UPDATE_HEARTBEAT + ' RETURNING *'
+_SQL_GET_AGENT = 'SELECT * FROM agents WHERE node_id = ?'
+_SQL_INSERT_LOG = (
+    'INSERT INTO logs (timestamp, node_id, protocol, attacker_ip, request_data, response_data, metadata) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?)'
+)
+_STATEMENT_CACHE_SIZE = 256
+
+# Python mirror of _not_private_ip_sql
+_PRIVATE_IP_PREFIXES = ('10.', '127.', '169.254.', '192.168.', '0.') + tuple(f'172.{i}.' for i in range(16, 32))
+
+
+class _JsonLogWriter:
+    """Background appender for the Filebeat JSON log files.
+
+    Request handlers only enqueue entries; a daemon thread serializes them
+    and appends to ``honeypot-YYYY-MM-DD.json`` in batches (every
+    ``flush_count`` entries or ``flush_interval`` seconds), keeping the
+    current day's file descriptor open between flushes.
+    """
+
+    _STOP = object()
+
+    def __init__(self, log_dir, flush_count=100, flush_interval=0.5):
+        self.log_dir = log_dir
+        self.flush_count = flush_count
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._dir_ready = False
+        self._fd = None
+        self._fd_date = None
+
+    def put(self, log_entries):
+        if not log_entries:
+            return
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="json-log-writer", daemon=True)
+                    self._thread.start()
+        self._queue.put((datetime.now().strftime("%Y-%m-%d"), log_entries))
+
+    def close(self):
+        """Flush everything queued so far and stop the writer thread."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(self._STOP)
+        thread.join()
+        self._thread = None
+
+    def _run(self):
+        pending = []
+        pending_count = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is self._STOP:
+                self._flush(pending)
+                self._close_fd()
+                return
+            if item is not None:
+                pending.append(item)
+                pending_count += len(item[1])
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if pending and (pending_count >= self.flush_count or time.monotonic() >= deadline):
+                self._flush(pending)
+                pending = []
+                pending_count = 0
+                deadline = None
+
+    def _flush(self, pending):
+        by_date = {}
+        for date_str, log_entries in pending:
+            by_date.setdefault(date_str, []).extend(log_entries)
+        for date_str, log_entries in by_date.items():
+            try:
+                payload = "".join(fast_json.dumps(entry) + "\n" for entry in log_entries)
+                data = payload.encode("utf-8")
+                fd = self._fd_for(date_str)
+                while data:
+                    written = os.write(fd, data)
+                    data = data[written:]
+            except Exception as e:
+                print(f"JSON Logging Error: {e}")
+                self._close_fd()
+
+    def _fd_for(self, date_str):
+        if self._fd is not None and self._fd_date == date_str:
+            return self._fd
+        self._close_fd()
+        if not self._dir_ready:
+            os.makedirs(self.log_dir, exist_ok=True)
+            self._dir_ready = True
+        log_file = os.path.join(self.log_dir, f"honeypot-{date_str}.json")
+        self._fd = os.open(log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._fd_date = date_str
+        return self._fd
+
+    def _close_fd(self):
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+        self._fd = None
+        self._fd_date = None
+
 
 class ServerDB:
     def __init__(self, db_path="server.db"):
         self.db_path = db_path
         self._write_lock = asyncio.Lock()
+        self._init_lock = asyncio.Lock()
+        self._writer = None
+        # Idle reader connections; see _ensure_connections
+        self._readers = None
+        self._reader_conns = []
+        # node_id -> (config_json text, parsed dict); see decode_agent_config
+        self._config_cache = {}
+        self._json_log = _JsonLogWriter(os.path.join(os.path.dirname(self.db_path), "logs"))
         try:
             self.agent_offline_after_seconds = int(os.environ.get("AGENT_OFFLINE_AFTER_SECONDS", "300"))
         except ValueError:
             self.agent_offline_after_seconds = 300
+        # Newest-first copy of the latest log rows so the dashboard's
+        # recent_logs poll doesn't have to hit SQLite. None = not loaded yet
+        # (or invalidated by a delete/rename); 0 disables it.
+        try:
+            self.recent_logs_buffer_size = max(0, int(os.environ.get("RECENT_LOGS_BUFFER_SIZE", "500")))
+        except ValueError:
+            self.recent_logs_buffer_size = 500
+        self._recent_logs = None
+        try:
+            self.reader_pool_size = max(1, int(os.environ.get("SQLITE_READER_POOL_SIZE", "4")))
+        except ValueError:
+            self.reader_pool_size = 4
+        # Total page cache shared by the reader pool; unindexed scans fill
+        # whatever each reader is given, so this is a budget, not per reader.
+        try:
+            self.reader_cache_mib = max(1, int(os.environ.get("SQLITE_READER_CACHE_MIB", "64")))
+        except ValueError:
+            self.reader_cache_mib = 64
         # Keep initial table creation synchronous to ensure DB exists at startup
         self._init_db_sync()
 
@@ -34,9 +207,14 @@ class ServerDB:
         # writer is mid-commit. Both are best-effort: if the DB is locked
         # by an old server we don't want to fail startup.
         try:
+            # Lets prune_logs hand freed pages back to the OS. auto_vacuum can
+            # only be switched on before the first table exists, so this only
+            # affects newly created DB files (existing ones need a VACUUM).
+            cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
             cursor.execute('PRAGMA journal_mode=WAL')
             cursor.execute('PRAGMA busy_timeout=10000')
             cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.execute('PRAGMA temp_store=MEMORY')
         except sqlite3.OperationalError as e:
             print(f"[db] PRAGMA setup skipped: {e}")
         
@@ -70,6 +248,34 @@ class ServerDB:
             cursor.execute('ALTER TABLE agents ADD COLUMN whitelist_json TEXT')
         except sqlite3.OperationalError:
             pass
+
+        # Migration: original_id mirrors config_json's original_id so the
+        # heartbeat adoption check is an index lookup instead of parsing
+        # every agent's config. The agents table is tiny, so the backfill
+        # and index are cheap enough to run on every startup.
+        try:
+            cursor.execute('ALTER TABLE agents ADD COLUMN original_id TEXT')
+        except sqlite3.OperationalError:
+            pass
+        try:
+            cursor.execute(
+                "UPDATE agents SET original_id = json_extract(config_json, '$.original_id') "
+                "WHERE original_id IS NULL AND json_valid(config_json)"
+            )
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_agents_original_id ON agents(original_id)')
+        except sqlite3.OperationalError as e:
+            print(f"[db] original_id backfill skipped: {e}")
+
+        # Migration: integer epoch copy of last_heartbeat. The ISO column stays
+        # for the dashboard and the Postgres migration; the staleness check in
+        # get_all_agents compares this one instead of parsing ISO strings.
+        try:
+            cursor.execute('ALTER TABLE agents ADD COLUMN last_heartbeat_epoch INTEGER')
+        except sqlite3.OperationalError:
+            pass
+        # No query filters on it, so an index would only slow every heartbeat
+        # UPDATE; drop the one earlier builds created.
+        cursor.execute('DROP INDEX IF EXISTS idx_agents_last_heartbeat')
         
         # LOGS Table
         cursor.execute('''
@@ -135,6 +341,7 @@ class ServerDB:
                 'CREATE INDEX IF NOT EXISTS idx_alerts_ip_id ON alerts(attacker_ip, id DESC)',
                 'CREATE INDEX IF NOT EXISTS idx_logs_ip ON logs(attacker_ip)',
                 'CREATE INDEX IF NOT EXISTS idx_logs_ts_ip ON logs(timestamp, attacker_ip)',
+                'CREATE INDEX IF NOT EXISTS idx_logs_node_ts ON logs(node_id, id DESC)',
             ):
                 try:
                     cursor.execute(idx_sql)
@@ -159,20 +366,116 @@ class ServerDB:
         conn.commit()
         conn.close()
 
+    async def _ensure_connections(self):
+        """Open the long-lived writer and reader connections on first use.
+
+        Reconnecting per call paid the file open, WAL attach and PRAGMA setup
+        on every request and threw away the page cache each time. WAL lets
+        readers see committed data while the writer is mid-transaction.
+        Each aiosqlite connection runs its queries on its own thread one at a
+        time, so reads are spread over a small pool: a slow scan (an
+        unindexed get_logs_by_ip, recent_logs with no limit) then only ties
+        up one reader while agent config fetches keep being served.
+        """
+        if self._writer is not None:
+            return
+
+        async with self._init_lock:
+            if self._writer is not None:
+                return
+            writer = await aiosqlite.connect(self.db_path, timeout=30, cached_statements=_STATEMENT_CACHE_SIZE)
+            readers = [
+                await aiosqlite.connect(self.db_path, timeout=20, cached_statements=_STATEMENT_CACHE_SIZE)
+                for _ in range(self.reader_pool_size)
+            ]
+            for db in (writer, *readers):
+                db.row_factory = aiosqlite.Row
+                for pragma in _CONNECTION_PRAGMAS:
+                    await db.execute(pragma)
+            await writer.execute('PRAGMA busy_timeout=30000')
+            await writer.execute(f'PRAGMA cache_size=-{_WRITER_CACHE_KIB}')
+            reader_cache_kib = max(_MIN_READER_CACHE_KIB, self.reader_cache_mib * 1024 // len(readers))
+            for reader in readers:
+                await reader.execute(f'PRAGMA cache_size=-{reader_cache_kib}')
+            idle = asyncio.Queue()
+            for reader in readers:
+                idle.put_nowait(reader)
+            self._reader_conns = readers
+            self._readers = idle
+            self._writer = writer
+
+    @contextlib.asynccontextmanager
+    async def _read(self):
+        await self._ensure_connections()
+        readers = self._readers
+        db = await readers.get()
+        try:
+            yield db
+        finally:
+            readers.put_nowait(db)
+
+    @contextlib.asynccontextmanager
+    async def _write(self):
+        """Serialize writers on the shared connection.
+
+        Anything a failed method left uncommitted is rolled back so it can't
+        leak into the next writer's transaction.
+        """
+        async with self._write_lock:
+            await self._ensure_connections()
+            try:
+                yield self._writer
+            finally:
+                if self._writer.in_transaction:
+                    await self._writer.rollback()
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._json_log.close)
+        for db in (self._writer, *self._reader_conns):
+            if db is not None:
+                await db.close()
+        self._writer = None
+        self._readers = None
+        self._reader_conns = []
+
     # --- Agent Management ---
     
     def _decode_agent_row(self, row):
         agent = dict(row)
         if agent.get('runtime_status_json'):
             try:
-                agent['runtime_status'] = json.loads(agent['runtime_status_json'])
+                agent['runtime_status'] = fast_json.loads(agent['runtime_status_json'])
             except Exception:
                 agent['runtime_status'] = {}
         else:
             agent['runtime_status'] = {}
         return agent
 
+    @staticmethod
+    def _original_id(config):
+        return config.get('original_id') if isinstance(config, dict) else None
+
+    def decode_agent_config(self, agent):
+        """Return the parsed config_json of an agent row.
+
+        Parsed configs are cached per node and reused while the stored text
+        is unchanged, so heartbeats don't re-parse the same JSON every time.
+        The returned dict is shared: copy it before mutating. Invalid JSON
+        raises ``json.JSONDecodeError``.
+        """
+        config_str = agent.get('config_json')
+        if not config_str:
+            return {}
+        node_id = agent.get('node_id')
+        cached = self._config_cache.get(node_id)
+        if cached is not None and cached[0] == config_str:
+            return cached[1]
+        parsed = fast_json.loads(config_str)
+        self._config_cache[node_id] = (config_str, parsed)
+        return parsed
+
     async def register_agent(self, node_id, name="Unknown Agent", ip="0.0.0.0", config=None, runtime_status=None):
+        self._config_cache.pop(node_id, None)
         now = datetime.now().isoformat()
         
         if config is None:
@@ -185,68 +488,88 @@ class ServerDB:
                 "deployments": []
             }
         
-        config_str = json.dumps(config)
-        runtime_status_str = json.dumps(runtime_status or {})
+        config_str = fast_json.dumps(config)
+        runtime_status_str = fast_json.dumps(runtime_status or {})
         
-        async with self._write_lock:
-            async with aiosqlite.connect(self.db_path, timeout=30) as db:
-                await db.execute('PRAGMA busy_timeout=30000')
-                # Check if agent exists to preserve is_active/runtime status/whitelist
-                async with db.execute('SELECT is_active, runtime_status_json, whitelist_json FROM agents WHERE node_id = ?', (node_id,)) as cursor:
-                    row = await cursor.fetchone()
-                    is_active = row[0] if row else 0 # Default to 0 (Inactive) if new agent
-                    if row and row[1] and not runtime_status:
-                        runtime_status_str = row[1]
-                    # Preserve existing whitelist — INSERT OR REPLACE would wipe it
-                    # because SQLite REPLACE = DELETE + INSERT.
-                    whitelist_json = row[2] if row else None
-
-                await db.execute('''
-                    INSERT OR REPLACE INTO agents (node_id, name, ip, last_heartbeat, status, config_json, is_active, runtime_status_json, whitelist_json)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (node_id, name, ip, now, "Online", config_str, is_active, runtime_status_str, whitelist_json))
+        async with self._write() as db:
+            # Upsert in one statement. New agents start inactive; existing ones
+            # keep is_active and whitelist_json (untouched by DO UPDATE), and
+            # keep their runtime status unless a non-empty one was supplied.
+            await db.execute('''
+                INSERT INTO agents (node_id, name, ip, last_heartbeat, last_heartbeat_epoch, status, config_json, is_active, runtime_status_json, original_id)
+                VALUES (?, ?, ?, ?, ?, 'Online', ?, 0, ?, ?)
+                ON CONFLICT(node_id) DO UPDATE SET
+                    name = excluded.name,
+                    ip = excluded.ip,
+                    last_heartbeat = excluded.last_heartbeat,
+                    last_heartbeat_epoch = excluded.last_heartbeat_epoch,
+                    status = 'Online',
+                    config_json = excluded.config_json,
+                    original_id = excluded.original_id,
+                    runtime_status_json = CASE
+                        WHEN ? THEN excluded.runtime_status_json
+                        ELSE COALESCE(NULLIF(agents.runtime_status_json, ''), excluded.runtime_status_json)
+                    END
+            ''', (node_id, name, ip, now, int(time.time()), config_str, runtime_status_str, self._original_id(config), 1 if runtime_status else 0))
                 
-                await db.commit()
+            await db.commit()
         return config
 
     async def update_heartbeat(self, node_id, ip=None, name=None, runtime_status=None):
+        """Mark an agent online and return its updated row, or None if unknown."""
         now = datetime.now().isoformat()
-        runtime_status_str = json.dumps(runtime_status or {})
-        async with self._write_lock:
-            async with aiosqlite.connect(self.db_path, timeout=30) as db:
-                await db.execute('PRAGMA busy_timeout=30000')
-                cursor = await db.execute(
-                    'UPDATE agents SET last_heartbeat = ?, status = ?, ip = COALESCE(?, ip), name = COALESCE(?, name), runtime_status_json = ? WHERE node_id = ?', 
-                    (now, "Online", ip, name, runtime_status_str, node_id)
-                )
-                changes = cursor.rowcount
-                await db.commit()
-        return changes > 0
+        runtime_status_str = fast_json.dumps(runtime_status or {})
+        params = (now, int(time.time()), "Online", ip, name, runtime_status_str, node_id)
+        async with self._write() as db:
+            if _HAS_RETURNING:
+                async with db.execute(_SQL_UPDATE_HEARTBEAT_RETURNING, params) as cursor:
+                    row = await cursor.fetchone()
+            else:
+                await db.execute(_SQL_UPDATE_HEARTBEAT, params)
+                async with db.execute(_SQL_GET_AGENT, (node_id,)) as cursor:
+                    row = await cursor.fetchone()
+            await db.commit()
+        return self._decode_agent_row(row) if row else None
 
     async def get_agent(self, node_id):
-        async with aiosqlite.connect(self.db_path, timeout=20) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute('SELECT * FROM agents WHERE node_id = ?', (node_id,)) as cursor:
+        async with self._read() as db:
+            async with db.execute(_SQL_GET_AGENT, (node_id,)) as cursor:
+                row = await cursor.fetchone()
+                if row:
+                    return self._decode_agent_row(row)
+        return None
+
+    async def get_agent_by_original_id(self, original_id):
+        """Find the agent a renamed node was adopted into, if any."""
+        async with self._read() as db:
+            async with db.execute(
+                'SELECT * FROM agents WHERE original_id = ? ORDER BY node_id LIMIT 1', (original_id,)
+            ) as cursor:
                 row = await cursor.fetchone()
                 if row:
                     return self._decode_agent_row(row)
         return None
 
     async def get_all_agents(self):
-        async with aiosqlite.connect(self.db_path, timeout=20) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute('SELECT * FROM agents ORDER BY node_id') as cursor:
                 rows = await cursor.fetchall()
         
         agents = []
+        now_epoch = int(time.time())
         for row in rows:
             agent = self._decode_agent_row(row)
             # Check timeout. Some nodes can spend a few minutes draining local
             # log backlog before their next heartbeat, so keep this tolerant
             # and configurable instead of using a hard-coded 30-second cutoff.
             try:
-                last_seen = datetime.fromisoformat(agent['last_heartbeat'])
-                heartbeat_age = (datetime.now() - last_seen).total_seconds()
+                last_epoch = agent.get('last_heartbeat_epoch')
+                if last_epoch is not None:
+                    heartbeat_age = now_epoch - last_epoch
+                else:
+                    # Rows that haven't heartbeated since the epoch column was added
+                    last_seen = datetime.fromisoformat(agent['last_heartbeat'])
+                    heartbeat_age = (datetime.now() - last_seen).total_seconds()
                 agent['heartbeat_age_seconds'] = int(heartbeat_age)
                 if heartbeat_age > self.agent_offline_after_seconds:
                     agent['status'] = 'Offline'
@@ -257,97 +580,80 @@ class ServerDB:
         return agents
         
     async def update_agent_config(self, node_id, config_dict, name=None):
-        config_str = json.dumps(config_dict)
-        async with self._write_lock:
-            async with aiosqlite.connect(self.db_path, timeout=30) as db:
-                await db.execute('PRAGMA busy_timeout=30000')
-                if name:
-                    await db.execute('UPDATE agents SET config_json = ?, name = ? WHERE node_id = ?', (config_str, name, node_id))
-                else:
-                    await db.execute('UPDATE agents SET config_json = ? WHERE node_id = ?', (config_str, node_id))
-                await db.commit()
+        """Store an agent's config. ``config_dict`` becomes the cached parsed
+        config for the node, so callers must not mutate it afterwards."""
+        config_str = fast_json.dumps(config_dict)
+        original_id = self._original_id(config_dict)
+        async with self._write() as db:
+            if name:
+                await db.execute('UPDATE agents SET config_json = ?, original_id = ?, name = ? WHERE node_id = ?', (config_str, original_id, name, node_id))
+            else:
+                await db.execute('UPDATE agents SET config_json = ?, original_id = ? WHERE node_id = ?', (config_str, original_id, node_id))
+            await db.commit()
+        self._config_cache[node_id] = (config_str, config_dict)
 
     async def rename_agent(self, old_node_id, new_node_id):
-        async with self._write_lock:
-            async with aiosqlite.connect(self.db_path, timeout=30) as db:
-                await db.execute('PRAGMA busy_timeout=30000')
-                try:
-                    # Check if new ID exists
-                    async with db.execute('SELECT 1 FROM agents WHERE node_id = ?', (new_node_id,)) as cursor:
-                        if await cursor.fetchone():
-                            return False, "New Node ID already exists"
+        self._config_cache.pop(old_node_id, None)
+        self._config_cache.pop(new_node_id, None)
+        async with self._write() as db:
+            try:
+                # Check if new ID exists
+                async with db.execute('SELECT 1 FROM agents WHERE node_id = ?', (new_node_id,)) as cursor:
+                    if await cursor.fetchone():
+                        return False, "New Node ID already exists"
 
-                    # Update agents table (whitelist_json stays with the row)
-                    await db.execute('UPDATE agents SET node_id = ? WHERE node_id = ?', (new_node_id, old_node_id))
+                # Update agents table (whitelist_json stays with the row)
+                await db.execute('UPDATE agents SET node_id = ? WHERE node_id = ?', (new_node_id, old_node_id))
                     
-                    # Update logs table
-                    await db.execute('UPDATE logs SET node_id = ? WHERE node_id = ?', (new_node_id, old_node_id))
+                # Update logs table
+                await db.execute('UPDATE logs SET node_id = ? WHERE node_id = ?', (new_node_id, old_node_id))
 
-                    # Update whitelist_logs table
-                    await db.execute('UPDATE whitelist_logs SET node_id = ? WHERE node_id = ?', (new_node_id, old_node_id))
+                # Update whitelist_logs table
+                await db.execute('UPDATE whitelist_logs SET node_id = ? WHERE node_id = ?', (new_node_id, old_node_id))
                     
-                    await db.commit()
-                    return True, "Renamed successfully"
-                except Exception as e:
-                    await db.rollback()
-                    return False, str(e)
+                await db.commit()
+                self._recent_logs = None
+                return True, "Renamed successfully"
+            except Exception as e:
+                await db.rollback()
+                return False, str(e)
 
     async def delete_agent(self, node_id):
-        async with self._write_lock:
-            async with aiosqlite.connect(self.db_path, timeout=30) as db:
-                await db.execute('PRAGMA busy_timeout=30000')
-                await db.execute('DELETE FROM logs WHERE node_id = ?', (node_id,))
-                await db.execute('DELETE FROM whitelist_logs WHERE node_id = ?', (node_id,))
-                await db.execute('DELETE FROM agents WHERE node_id = ?', (node_id,))
-                await db.commit()
+        self._config_cache.pop(node_id, None)
+        async with self._write() as db:
+            await db.execute('DELETE FROM logs WHERE node_id = ?', (node_id,))
+            await db.execute('DELETE FROM whitelist_logs WHERE node_id = ?', (node_id,))
+            await db.execute('DELETE FROM agents WHERE node_id = ?', (node_id,))
+            await db.commit()
+            self._recent_logs = None
 
     async def toggle_agent_active(self, node_id, is_active):
         val = 1 if is_active else 0
-        async with self._write_lock:
-            async with aiosqlite.connect(self.db_path, timeout=30) as db:
-                await db.execute('PRAGMA busy_timeout=30000')
-                await db.execute('UPDATE agents SET is_active = ? WHERE node_id = ?', (val, node_id))
-                await db.commit()
+        async with self._write() as db:
+            await db.execute('UPDATE agents SET is_active = ? WHERE node_id = ?', (val, node_id))
+            await db.commit()
 
     # --- Per-Agent Whitelist ---
 
     async def get_agent_whitelist(self, node_id):
-        async with aiosqlite.connect(self.db_path, timeout=20) as db:
+        async with self._read() as db:
             async with db.execute('SELECT whitelist_json FROM agents WHERE node_id = ?', (node_id,)) as cursor:
                 row = await cursor.fetchone()
                 if row and row[0]:
                     try:
-                        return json.loads(row[0])
+                        return fast_json.loads(row[0])
                     except (json.JSONDecodeError, TypeError):
                         pass
         return None
 
     async def update_agent_whitelist(self, node_id, whitelist_dict):
-        whitelist_str = json.dumps(whitelist_dict, ensure_ascii=False)
-        async with self._write_lock:
-            async with aiosqlite.connect(self.db_path, timeout=30) as db:
-                await db.execute('PRAGMA busy_timeout=30000')
-                await db.execute('UPDATE agents SET whitelist_json = ? WHERE node_id = ?', (whitelist_str, node_id))
-                await db.commit()
+        whitelist_str = fast_json.dumps(whitelist_dict)
+        async with self._write() as db:
+            await db.execute('UPDATE agents SET whitelist_json = ? WHERE node_id = ?', (whitelist_str, node_id))
+            await db.commit()
 
     # --- Log Management ---
 
-    async def _log_to_json_file(self, log_entry):
-        try:
-            # Ensure log directory exists
-            log_dir = os.path.join(os.path.dirname(self.db_path), "logs")
-            if not os.path.exists(log_dir):
-                os.makedirs(log_dir)
-
-            # Filename by date
-            date_str = datetime.now().strftime("%Y-%m-%d")
-            log_file = os.path.join(log_dir, f"honeypot-{date_str}.json")
-
-            async with aiofiles.open(log_file, "a") as f:
-                await f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
-        except Exception as e:
-            print(f"JSON Logging Error: {e}")
-
     @staticmethod
     def _parse_metadata(meta):
         """Parse metadata string to dict, handling edge cases"""
@@ -357,12 +663,32 @@ class ServerDB:
             if meta in ("None", "null", ""):
                 return {}
             try:
-                parsed = json.loads(meta)
+                parsed = fast_json.loads(meta)
                 return parsed if isinstance(parsed, dict) else {"raw": meta}
             except (json.JSONDecodeError, ValueError):
                 return {"raw": meta}
         return {}
 
+    @staticmethod
+    def _encode_metadata(meta):
+        """Return (meta_dict, meta_str) for a log's metadata field.
+
+        A string that already holds a JSON object is stored as-is rather
+        than being re-serialized from the parsed dict.
+        """
+        meta_dict = ServerDB._parse_metadata(meta)
+        if type(meta) is str and meta_dict and "raw" not in meta_dict:
+            return meta_dict, meta
+        return meta_dict, fast_json.dumps(meta_dict)
+
+    @staticmethod
+    def _to_db_text(value):
+        """JSON-encode dict/list payloads; other values are stored as given."""
+        t = type(value)
+        if t is dict or t is list:
+            return fast_json.dumps(value)
+        return value
+
     @staticmethod
     def _build_elk_entry(node_id, timestamp, attacker_ip, protocol, req, resp, meta_dict):
         """
@@ -426,38 +752,57 @@ class ServerDB:
 
     async def insert_logs(self, node_id, logs):
         rows = []
+        elk_entries = []
+        encode_metadata = self._encode_metadata
+        build_elk_entry = self._build_elk_entry
+        to_db_text = self._to_db_text
+        # Receive time for entries without their own timestamp, shared by the batch
+        now_iso = datetime.now().isoformat()
         for log in logs:
             # log dict structure from client: {timestamp, attacker_ip, protocol, request_data, response_data, metadata}
-            timestamp = log.get('timestamp') or datetime.now().isoformat()
+            timestamp = log.get('timestamp') or now_iso
             attacker_ip = log.get('attacker_ip')
             protocol = log.get('protocol')
             req = log.get('request_data')
             resp = log.get('response_data')
             meta = log.get('metadata')
 
-            meta_dict = self._parse_metadata(meta)
-            elk_entry = self._build_elk_entry(
+            meta_dict, meta_str = encode_metadata(meta)
+            # ELK keeps request/response as nested objects; only the DB row
+            # needs them as text.
+            elk_entries.append(build_elk_entry(
                 node_id, timestamp, attacker_ip, protocol, req, resp, meta_dict
-            )
-            await self._log_to_json_file(elk_entry)
-
-            meta_str = json.dumps(meta_dict, ensure_ascii=False) if isinstance(meta_dict, dict) else str(meta_dict)
-            if isinstance(req, (dict, list)): req = json.dumps(req)
-            if isinstance(resp, (dict, list)): resp = json.dumps(resp)
-            rows.append((timestamp, node_id, protocol, attacker_ip, req, resp, meta_str))
+            ))
+            rows.append((timestamp, node_id, protocol, attacker_ip, to_db_text(req), to_db_text(resp), meta_str))
 
         if not rows:
             return 0
 
-        async with self._write_lock:
-            async with aiosqlite.connect(self.db_path, timeout=30) as db:
-                await db.execute('PRAGMA busy_timeout=30000')
-                await db.executemany('''
-                    INSERT INTO logs (timestamp, node_id, protocol, attacker_ip, request_data, response_data, metadata)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', rows)
-
-                await db.commit()
+        async with self._write() as db:
+            await db.executemany(_SQL_INSERT_LOG, rows)
+            recent = self._recent_logs
+            if recent is not None:
+                # The batch is written under the write lock in one
+                # transaction, so its ids are consecutive up to the last one.
+                # Read the rows back rather than reusing the bound values:
+                # TEXT affinity stores scalars like 5 or True as '5'/'1', and
+                # the buffer has to match what a SELECT returns.
+                async with db.execute('SELECT last_insert_rowid()') as cursor:
+                    last_id = (await cursor.fetchone())[0]
+                async with db.execute(
+                    'SELECT * FROM logs WHERE id > ? ORDER BY id',
+                    (last_id - min(len(rows), recent.maxlen),),
+                ) as cursor:
+                    columns = [col[0] for col in cursor.description]
+                    inserted = await cursor.fetchall()
+            await db.commit()
+            if recent is not None and recent is self._recent_logs:
+                for row in inserted:
+                    recent.appendleft(dict(zip(columns, row)))
+
+        # Mirror to the Filebeat JSON file only once the batch is committed,
+        # so ELK never sees rows the DB rejected.
+        self._json_log.put(elk_entries)
         return len(rows)
 
     @staticmethod
@@ -475,9 +820,52 @@ class ServerDB:
         private_checks.extend(f"{column} LIKE '172.{i}.%'" for i in range(16, 32))
         return f"NOT ({' OR '.join(private_checks)})"
 
+    async def _load_recent_logs(self):
+        # Under the write lock so no insert lands between the SELECT and
+        # the buffer being published.
+        size = self.recent_logs_buffer_size
+        async with self._write() as db:
+            async with db.execute('SELECT * FROM logs ORDER BY id DESC LIMIT ?', (size,)) as cursor:
+                columns = [col[0] for col in cursor.description]
+                rows = await cursor.fetchall()
+            self._recent_logs = collections.deque((dict(zip(columns, row)) for row in rows), maxlen=size)
+        return self._recent_logs
+
+    def _recent_logs_from_buffer(self, recent, limit, exclude_ips, hide_private_ips):
+        """Answer get_recent_logs from the buffer, or None if it can't.
+
+        The buffer holds every row while it is below capacity; once full,
+        older rows may be missing, so a filter that leaves fewer than
+        ``limit`` matches has to go to the DB.
+        """
+        excluded = set(exclude_ips)
+        result = []
+        for log in recent:
+            ip = log['attacker_ip']
+            if not ip or ip in excluded:
+                continue
+            if hide_private_ips and (
+                ip.startswith(_PRIVATE_IP_PREFIXES) or ip == '::1' or ip[:2].lower() in ('fc', 'fd')
+            ):
+                continue
+            result.append(dict(log))
+            if len(result) == limit:
+                return result
+        if len(recent) < recent.maxlen:
+            return result
+        return None
+
     async def get_recent_logs(self, limit=100, exclude_ips=None, hide_private_ips=False):
-        async with aiosqlite.connect(self.db_path, timeout=20) as db:
-            db.row_factory = aiosqlite.Row
+        if limit is not None and 0 < limit <= self.recent_logs_buffer_size:
+            recent = self._recent_logs
+            if recent is None:
+                recent = await self._load_recent_logs()
+            result = self._recent_logs_from_buffer(
+                recent, limit, [ip for ip in (exclude_ips or []) if ip], hide_private_ips
+            )
+            if result is not None:
+                return result
+        async with self._read() as db:
             where = ["attacker_ip IS NOT NULL", "attacker_ip != ''"]
             params = []
             exclude_ips = [ip for ip in (exclude_ips or []) if ip]
@@ -496,23 +884,71 @@ class ServerDB:
                     [*params, limit],
                 )
             async with cursor_ctx as cursor:
+                columns = [col[0] for col in cursor.description]
                 rows = await cursor.fetchall()
-        return [dict(row) for row in rows]
+        return [dict(zip(columns, row)) for row in rows]
 
     async def get_agent_ips(self):
-        async with aiosqlite.connect(self.db_path, timeout=20) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute("SELECT DISTINCT ip FROM agents WHERE ip IS NOT NULL AND ip != ''") as cursor:
                 rows = await cursor.fetchall()
         return [row["ip"] for row in rows]
 
     async def delete_agent_logs(self, node_id):
         """Delete all logs for a specific agent"""
-        async with self._write_lock:
-            async with aiosqlite.connect(self.db_path, timeout=30) as db:
-                await db.execute('PRAGMA busy_timeout=30000')
-                await db.execute('DELETE FROM logs WHERE node_id = ?', (node_id,))
+        async with self._write() as db:
+            await db.execute('DELETE FROM logs WHERE node_id = ?', (node_id,))
+            await db.commit()
+            self._recent_logs = None
+
+    async def prune_logs(self, keep_days, batch_size=5000):
+        """Delete logs older than ``keep_days`` days. Returns rows deleted.
+
+        Rows are matched on their own timestamp and deleted in short
+        batches (oldest ids first) to avoid holding the write lock for long.
+        Rows whose timestamp doesn't sort as ISO time are left alone without
+        shielding the rows around them.
+        """
+        cutoff = (datetime.now() - timedelta(days=keep_days)).isoformat()
+        deleted = 0
+        while True:
+            async with self._write() as db:
+                cursor = await db.execute(
+                    'DELETE FROM logs WHERE id IN (SELECT id FROM logs WHERE timestamp < ? ORDER BY id LIMIT ?)',
+                    (cutoff, batch_size),
+                )
+                count = cursor.rowcount
                 await db.commit()
+                if count:
+                    self._recent_logs = None
+            deleted += count
+            if count < batch_size:
+                break
+            await asyncio.sleep(0)
+
+        if deleted:
+            await self._incremental_vacuum()
+        return deleted
+
+    async def _incremental_vacuum(self, pages_per_step=1000):
+        """Return the freelist to the OS a bounded number of pages at a time.
+
+        No-op unless the DB was created with auto_vacuum=INCREMENTAL. The
+        pragma frees one page per step and returns no columns, so execute()
+        resets it after the first step (even with a fetchall); executescript()
+        steps it to completion. The write lock is released between chunks so
+        log uploads and heartbeats interleave with a large vacuum.
+        """
+        while True:
+            async with self._write() as db:
+                async with db.execute('PRAGMA auto_vacuum') as cursor:
+                    mode = (await cursor.fetchone())[0]
+                async with db.execute('PRAGMA freelist_count') as cursor:
+                    free_pages = (await cursor.fetchone())[0]
+                if mode != 2 or not free_pages:
+                    return
+                await db.executescript(f'PRAGMA incremental_vacuum({pages_per_step})')
+            await asyncio.sleep(0)
 
     # ---------- Whitelist log methods ----------
 
@@ -520,41 +956,35 @@ class ServerDB:
         """Insert friendly traffic into whitelist_logs.
 
         Mirrors insert_logs() but writes to whitelist_logs instead and
-        intentionally does NOT call _log_to_json_file() — whitelist entries
+        intentionally does NOT queue to the JSON log writer — whitelist entries
         must not appear in the ELK ingest stream.
         """
         rows = []
+        encode_metadata = self._encode_metadata
+        to_db_text = self._to_db_text
+        now_iso = datetime.now().isoformat()
         for log in logs:
-            timestamp = log.get('timestamp') or datetime.now().isoformat()
-            attacker_ip = log.get('attacker_ip')
-            protocol = log.get('protocol')
-            req = log.get('request_data')
-            resp = log.get('response_data')
-            meta = log.get('metadata')
-
-            meta_dict = self._parse_metadata(meta)
-            meta_str = json.dumps(meta_dict, ensure_ascii=False) if isinstance(meta_dict, dict) else str(meta_dict)
-            if isinstance(req, (dict, list)): req = json.dumps(req)
-            if isinstance(resp, (dict, list)): resp = json.dumps(resp)
-            rows.append((timestamp, node_id, protocol, attacker_ip, req, resp, meta_str))
+            timestamp = log.get('timestamp') or now_iso
+            _, meta_str = encode_metadata(log.get('metadata'))
+            rows.append((
+                timestamp, node_id, log.get('protocol'), log.get('attacker_ip'),
+                to_db_text(log.get('request_data')), to_db_text(log.get('response_data')), meta_str,
+            ))
 
         if not rows:
             return 0
 
-        async with self._write_lock:
-            async with aiosqlite.connect(self.db_path, timeout=30) as db:
-                await db.execute('PRAGMA busy_timeout=30000')
-                await db.executemany('''
-                    INSERT INTO whitelist_logs (timestamp, node_id, protocol, attacker_ip, request_data, response_data, metadata)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', rows)
+        async with self._write() as db:
+            await db.executemany('''
+                INSERT INTO whitelist_logs (timestamp, node_id, protocol, attacker_ip, request_data, response_data, metadata)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
 
-                await db.commit()
+            await db.commit()
         return len(rows)
 
     async def get_recent_whitelist_logs(self, limit=100, node_id=None):
-        async with aiosqlite.connect(self.db_path, timeout=20) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             if node_id:
                 query = 'SELECT * FROM whitelist_logs WHERE node_id = ? ORDER BY id DESC LIMIT ?'
                 params = (node_id, limit)
@@ -567,11 +997,9 @@ class ServerDB:
 
     async def delete_agent_whitelist_logs(self, node_id):
         """Delete all whitelist logs for a specific agent"""
-        async with self._write_lock:
-            async with aiosqlite.connect(self.db_path, timeout=30) as db:
-                await db.execute('PRAGMA busy_timeout=30000')
-                await db.execute('DELETE FROM whitelist_logs WHERE node_id = ?', (node_id,))
-                await db.commit()
+        async with self._write() as db:
+            await db.execute('DELETE FROM whitelist_logs WHERE node_id = ?', (node_id,))
+            await db.commit()
 
     # ---------- IP analysis (used by attack-map analysis panel) ----------
 
@@ -705,26 +1133,31 @@ class ServerDB:
         params.append(limit)
 
         db_uri = f"file:{self.db_path}?mode=ro"
-        conn = sqlite3.connect(db_uri, uri=True, timeout=2)
-        conn.row_factory = sqlite3.Row
-        try:
-            conn.execute("PRAGMA busy_timeout=2000")
-            deadline = time.monotonic() + float(
-                os.environ.get("IP_ANALYSIS_QUERY_TIMEOUT_SECONDS", "5")
-            )
-            conn.set_progress_handler(
-                lambda: 1 if time.monotonic() > deadline else 0,
-                1000,
-            )
-            cursor = conn.execute(sql, params)
-            return [dict(r) for r in cursor.fetchall()]
-        finally:
-            conn.set_progress_handler(None, 0)
-            conn.close()
+
+        def run_query():
+            conn = sqlite3.connect(db_uri, uri=True, timeout=2)
+            conn.row_factory = sqlite3.Row
+            try:
+                conn.execute("PRAGMA busy_timeout=2000")
+                deadline = time.monotonic() + float(
+                    os.environ.get("IP_ANALYSIS_QUERY_TIMEOUT_SECONDS", "5")
+                )
+                conn.set_progress_handler(
+                    lambda: 1 if time.monotonic() > deadline else 0,
+                    1000,
+                )
+                cursor = conn.execute(sql, params)
+                return [dict(r) for r in cursor.fetchall()]
+            finally:
+                conn.set_progress_handler(None, 0)
+                conn.close()
+
+        # The rollup can run for seconds on a large logs table; keep it off
+        # the event loop so heartbeats and log uploads aren't stalled.
+        return await asyncio.get_running_loop().run_in_executor(None, run_query)
 
     async def get_logs_by_ip(self, ip, limit=200):
-        async with aiosqlite.connect(self.db_path, timeout=20) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute(
                 'SELECT * FROM logs WHERE attacker_ip = ? ORDER BY id DESC LIMIT ?',
                 (ip, limit),
@@ -736,43 +1169,42 @@ class ServerDB:
 
     async def insert_alert(self, alert: dict) -> bool:
         """Insert one alert. Returns True if newly inserted, False if duplicate."""
-        async with self._write_lock:
-            async with aiosqlite.connect(self.db_path, timeout=30) as db:
-                await db.execute('PRAGMA busy_timeout=30000')
-                try:
-                    await db.execute(
-                        '''INSERT OR IGNORE INTO alerts
-                           (timestamp, attacker_ip, node_id, protocol, signature, signature_id,
-                            category, severity, src_ip, src_port, dst_ip, dst_port, log_id, source, metadata)
-                           VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)''',
-                        (
-                            alert.get("timestamp") or datetime.now().isoformat(),
-                            alert.get("attacker_ip"),
-                            alert.get("node_id"),
-                            alert.get("protocol"),
-                            alert.get("signature"),
-                            alert.get("signature_id"),
-                            alert.get("category"),
-                            alert.get("severity") or 3,
-                            alert.get("src_ip"),
-                            alert.get("src_port") or 0,
-                            alert.get("dst_ip"),
-                            alert.get("dst_port") or 0,
-                            alert.get("log_id"),
-                            alert.get("source") or "internal",
-                            json.dumps(alert.get("metadata") or {}, ensure_ascii=False),
-                        ),
-                    )
-                    changes = db.total_changes
-                    await db.commit()
-                    return changes > 0
-                except Exception as e:
-                    print(f"insert_alert error: {e}")
-                    return False
+        async with self._write() as db:
+            try:
+                cursor = await db.execute(
+                    '''INSERT OR IGNORE INTO alerts
+                       (timestamp, attacker_ip, node_id, protocol, signature, signature_id,
+                        category, severity, src_ip, src_port, dst_ip, dst_port, log_id, source, metadata)
+                       VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)''',
+                    (
+                        alert.get("timestamp") or datetime.now().isoformat(),
+                        alert.get("attacker_ip"),
+                        alert.get("node_id"),
+                        alert.get("protocol"),
+                        alert.get("signature"),
+                        alert.get("signature_id"),
+                        alert.get("category"),
+                        alert.get("severity") or 3,
+                        alert.get("src_ip"),
+                        alert.get("src_port") or 0,
+                        alert.get("dst_ip"),
+                        alert.get("dst_port") or 0,
+                        alert.get("log_id"),
+                        alert.get("source") or "internal",
+                        fast_json.dumps(alert.get("metadata") or {}),
+                    ),
+                )
+                # rowcount, not total_changes: the latter is cumulative over
+                # the lifetime of the shared connection.
+                changes = cursor.rowcount
+                await db.commit()
+                return changes > 0
+            except Exception as e:
+                print(f"insert_alert error: {e}")
+                return False
 
     async def get_alerts(self, limit=200, ip=None):
-        async with aiosqlite.connect(self.db_path, timeout=20) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             if ip:
                 sql = 'SELECT * FROM alerts WHERE attacker_ip = ? ORDER BY id DESC LIMIT ?'
                 params = (ip, limit)
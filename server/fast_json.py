@@ -0,0 +1,56 @@
+"""
+JSON helpers backed by orjson when it is installed.
+
+orjson parses several times faster than the stdlib ``json`` module. It is
+optional: without it every helper falls back to ``json`` with the same
+call signature, so callers never need to check which backend is active.
+"""
+
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+HAS_ORJSON = orjson is not None
+
+# orjson reads integers beyond 64 bits as floats instead of failing, so any
+# document with a 19+ digit run goes straight to the stdlib parser.
+_LONG_DIGITS = re.compile(r"\d{19,}")
+_LONG_DIGITS_BYTES = re.compile(rb"\d{19,}")
+
+
+def loads(data):
+    """Parse JSON from ``str`` or ``bytes``.
+
+    Input orjson rejects is retried with the stdlib parser, so the result
+    always matches ``json.loads``: ``NaN``/``Infinity`` literals are
+    accepted and integers wider than 64 bits stay ints. Invalid input
+    raises ``json.JSONDecodeError``.
+    """
+    if orjson is not None:
+        pattern = _LONG_DIGITS if isinstance(data, str) else _LONG_DIGITS_BYTES
+        if not pattern.search(data):
+            try:
+                return orjson.loads(data)
+            except orjson.JSONDecodeError:
+                pass
+    return json.loads(data)
+
+
+def dumps(obj):
+    """Serialize ``obj`` to a compact JSON ``str``.
+
+    Non-ASCII text is written as UTF-8 rather than ``\\u`` escapes. Values
+    orjson refuses (integers wider than 64 bits, unknown types) are retried
+    with the stdlib encoder. Unlike ``json.dumps``, orjson writes ``NaN``
+    and ``Infinity`` floats as ``null``.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
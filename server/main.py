@@ -1,5 +1,5 @@
 from fastapi import FastAPI, Request, HTTPException, Form, UploadFile, File, Depends, Header
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
@@ -19,8 +19,11 @@ import json
 import time
 import urllib.request
 import urllib.error
+import contextlib
+from contextlib import asynccontextmanager
 from pathlib import Path
 from datetime import datetime
+import fast_json
 from database import ServerDB
 from postgres_database import PostgresServerDB
 from auth_config import load_secrets, verify_password, verify_api_key
@@ -129,7 +132,45 @@ def get_server_public_url(request: Request = None) -> str:
     return f"http://localhost:{SERVER_PORT}"
 
 
-app = FastAPI(title="Honeypot Central Server")
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, "").strip() or default)
+    except ValueError:
+        print(f"Invalid {name}; using {default}")
+        return default
+
+
+# Log retention: 0 (the default) keeps logs forever.
+LOG_RETENTION_DAYS = _env_int("LOG_RETENTION_DAYS", 0)
+LOG_PRUNE_INTERVAL_SECONDS = max(60, _env_int("LOG_PRUNE_INTERVAL_SECONDS", 3600))
+
+
+async def _prune_logs_periodically():
+    while True:
+        try:
+            deleted = await db.prune_logs(LOG_RETENTION_DAYS)
+            if deleted:
+                print(f"Pruned {deleted} logs older than {LOG_RETENTION_DAYS} days")
+        except Exception as e:
+            print(f"Log pruning failed: {e}")
+        await asyncio.sleep(LOG_PRUNE_INTERVAL_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    prune_task = None
+    if LOG_RETENTION_DAYS > 0:
+        prune_task = asyncio.create_task(_prune_logs_periodically())
+    yield
+    if prune_task is not None:
+        prune_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await prune_task
+    # Release the DB backend's long-lived connections / pool on shutdown
+    await db.close()
+
+
+app = FastAPI(title="Honeypot Central Server", lifespan=lifespan)
 
 
 # Add CORS middleware for cross-origin requests (needed when frontend is served from a different domain)
@@ -308,27 +349,17 @@ async def heartbeat(hb: Heartbeat, request: Request):
         # one closest to the real edge (detected from the connection).
         hb.ip = detected_ip
 
-    # Register or update status
-    existing = await db.get_agent(hb.node_id)
+    # Update status; the updated row comes back from the same statement
+    existing = await db.update_heartbeat(hb.node_id, ip=hb.ip, name=hb.name, runtime_status=hb.deployment_status or {})
 
     command = "start" # Default command
     response_extras = {}
 
     if not existing:
         # 1. Adoption Check: Check if this node_id was renamed to something else
-        # Scan all agents to see if 'original_id' matches hb.node_id
-        # (Optimization: In a large system this should be a DB query, but fine for prototype)
-        all_agents = await db.get_all_agents()
-        adopted_agent = None
-        for agent in all_agents:
-            try:
-                conf = json.loads(agent['config_json'])
-                if conf.get('original_id') == hb.node_id:
-                    adopted_agent = agent
-                    break
-            except:
-                pass
-        
+        # (indexed lookup on the agent's stored original_id)
+        adopted_agent = await db.get_agent_by_original_id(hb.node_id)
+
         if adopted_agent:
             # Found! This agent was renamed. Tell client to update.
             print(f"Adoption match: {hb.node_id} -> {adopted_agent['node_id']}")
@@ -365,13 +396,11 @@ async def heartbeat(hb: Heartbeat, request: Request):
         return {"status": "registered", "command": "start"}
 
     else:
-        # Existing Agent
-        await db.update_heartbeat(hb.node_id, ip=hb.ip, name=hb.name, runtime_status=hb.deployment_status or {})
-
+        # Existing Agent (heartbeat already recorded above)
         if hb.config:
             server_config = {}
             try:
-                server_config = json.loads(existing.get("config_json") or "{}")
+                server_config = db.decode_agent_config(existing)
             except Exception:
                 server_config = {}
 
@@ -386,7 +415,11 @@ async def heartbeat(hb: Heartbeat, request: Request):
             merged_config = dict(server_config)
             merged_config.update(client_config)
             merged_config["deployments"] = _merge_deployments(server_deployments, client_deployments)
-            await db.update_agent_config(hb.node_id, merged_config, name=hb.name)
+            # Most heartbeats carry the config the server already has; only
+            # re-serialize and write it when the merge actually changed it.
+            # (The name was already updated by update_heartbeat.)
+            if merged_config != server_config:
+                await db.update_agent_config(hb.node_id, merged_config, name=hb.name)
         
         # Check active status
         if existing['is_active'] == 0:
@@ -401,10 +434,8 @@ async def get_config(node_id: str, request: Request):
         raise HTTPException(status_code=404, detail="Agent not found. please wait for auto-registration.")
 
     try:
-        if agent['config_json']:
-            response_data = json.loads(agent['config_json'])
-        else:
-            response_data = {}
+        # Copy: the decoded config is cached and shared across requests
+        response_data = dict(db.decode_agent_config(agent))
     except json.JSONDecodeError:
         print(f"Error decoding config for {node_id}: Invalid JSON")
         # Fallback to empty or minimal config
@@ -567,6 +598,12 @@ PROFILES_DIR = os.path.join(os.path.dirname(BASE_DIR), "client", "profiles")
 
 import aiofiles
 
+# Profiles change rarely, so keep the parsed results and only re-read when a
+# file's (mtime, size) changes. The listing cache is keyed by the signature of
+# every profile file; the per-profile cache by path.
+_profiles_cache = {"signature": None, "data": None}
+_profile_cache: Dict[str, Any] = {}
+
 @app.get("/api/profiles", dependencies=[Depends(require_session)])
 async def list_profiles():
     """List available profile files"""
@@ -575,29 +612,41 @@ async def list_profiles():
         return []
     
     profiles = []
-    # os.listdir is fast enough for small directories, but reading content should be async
+    # scandir hands back DirEntry objects with cached type info, so
+    # filtering out subdirectories doesn't cost an extra stat per entry
     try:
-        for f in os.listdir(PROFILES_DIR):
-            if f.endswith(".json"):
-                name = f.replace(".json", "")
-                # Read minimal metadata
-                try:
-                    async with aiofiles.open(os.path.join(PROFILES_DIR, f), 'r') as file:
-                        content = await file.read()
-                        data = json.loads(content)
-                        desc = data.get("description", "No description")
-                        profiles.append({
-                            "name": name,
-                            "description": desc,
-                            # Check protocols
-                            "type": "modbus"
-                        })
-                except:
-                    continue
+        with os.scandir(PROFILES_DIR) as entries:
+            profile_entries = sorted(
+                (e for e in entries if e.name.endswith(".json") and e.is_file()),
+                key=lambda e: e.name,
+            )
+        signature = tuple(
+            (e.name, st.st_mtime_ns, st.st_size) for e, st in ((e, e.stat()) for e in profile_entries)
+        )
+        if signature == _profiles_cache["signature"]:
+            return _profiles_cache["data"]
+        for entry in profile_entries:
+            name = entry.name[:-5]
+            # Read minimal metadata
+            try:
+                async with aiofiles.open(entry.path, 'rb') as file:
+                    content = await file.read()
+                    data = fast_json.loads(content)
+                    desc = data.get("description", "No description")
+                    profiles.append({
+                        "name": name,
+                        "description": desc,
+                        # Check protocols
+                        "type": "modbus"
+                    })
+            except:
+                continue
     except Exception as e:
         print(f"Error listing profiles: {e}")
         return []
-        
+
+    _profiles_cache["signature"] = signature
+    _profiles_cache["data"] = profiles
     return profiles
 
 @app.get("/api/profiles/{name}", dependencies=[Depends(require_session)])
@@ -615,15 +664,25 @@ async def get_profile(name: str):
     if not resolved_path.startswith(os.path.realpath(PROFILES_DIR)):
         raise HTTPException(status_code=400, detail="Invalid profile name")
     
-    if not os.path.exists(file_path):
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        _profile_cache.pop(file_path, None)
         raise HTTPException(status_code=404, detail="Profile not found")
-    
+
+    file_sig = (st.st_mtime_ns, st.st_size)
+    cached = _profile_cache.get(file_path)
+    if cached is not None and cached[0] == file_sig:
+        return cached[1]
+
     try:
-        async with aiofiles.open(file_path, 'r') as f:
+        async with aiofiles.open(file_path, 'rb') as f:
             content = await f.read()
-            return json.loads(content)
+            data = fast_json.loads(content)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    _profile_cache[file_path] = (file_sig, data)
+    return data
 
 
 UPLOADS_DIR = os.path.join(BASE_DIR, "uploads")
@@ -1169,7 +1228,9 @@ async def recent_logs(
         )
     except asyncio.TimeoutError:
         raise HTTPException(status_code=503, detail="Recent logs query timed out; retry shortly")
-    return logs
+    # Rows are plain str/int/None, so serialize them directly and skip
+    # FastAPI's jsonable_encoder pass over every field.
+    return Response(content=fast_json.dumps(logs), media_type="application/json")
 
 
 @app.get("/api/dashboard_stats", dependencies=[Depends(require_session)])
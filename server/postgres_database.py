@@ -5,6 +5,8 @@ from datetime import datetime, timedelta, timezone
 
 import aiofiles
 
+import fast_json
+
 
 def _is_unique_violation(exc):
     return exc.__class__.__name__ == "UniqueViolationError"
@@ -15,6 +17,8 @@ class PostgresServerDB:
         self.database_url = database_url
         self._pool = None
         self._init_lock = asyncio.Lock()
+        # node_id -> (config_json text, parsed dict); see decode_agent_config
+        self._config_cache = {}
         try:
             self.agent_offline_after_seconds = int(os.environ.get("AGENT_OFFLINE_AFTER_SECONDS", "300"))
         except ValueError:
@@ -45,6 +49,11 @@ class PostgresServerDB:
             await self._init_schema()
             return self._pool
 
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
     async def _init_schema(self):
         async with self._pool.acquire() as conn:
             await conn.execute(
@@ -58,9 +67,13 @@ class PostgresServerDB:
                     config_json TEXT,
                     is_active INTEGER DEFAULT 1,
                     runtime_status_json TEXT,
-                    whitelist_json TEXT
+                    whitelist_json TEXT,
+                    original_id TEXT
                 );
 
+                ALTER TABLE agents ADD COLUMN IF NOT EXISTS original_id TEXT;
+                CREATE INDEX IF NOT EXISTS idx_agents_original_id ON agents(original_id);
+
                 CREATE TABLE IF NOT EXISTS logs (
                     id BIGSERIAL PRIMARY KEY,
                     timestamp TEXT,
@@ -126,6 +139,19 @@ class PostgresServerDB:
                 CREATE INDEX IF NOT EXISTS idx_ip_summaries_last_seen ON ip_summaries(last_seen DESC, ip);
                 """
             )
+            # Backfill original_id from config_json for agents created before
+            # the column existed. Rows with unparsable config stay NULL.
+            for node_id, config_json in await conn.fetch(
+                "SELECT node_id, config_json FROM agents WHERE original_id IS NULL AND config_json IS NOT NULL"
+            ):
+                try:
+                    original_id = self._original_id(fast_json.loads(config_json))
+                except (json.JSONDecodeError, TypeError):
+                    continue
+                if original_id:
+                    await conn.execute(
+                        "UPDATE agents SET original_id = $1 WHERE node_id = $2", original_id, node_id
+                    )
             for table in ("logs", "whitelist_logs", "alerts"):
                 await conn.execute(
                     f"""
@@ -138,18 +164,42 @@ class PostgresServerDB:
                     """
                 )
 
+    @staticmethod
+    def _original_id(config):
+        return config.get("original_id") if isinstance(config, dict) else None
+
     def _decode_agent_row(self, row):
         agent = dict(row)
         if agent.get("runtime_status_json"):
             try:
-                agent["runtime_status"] = json.loads(agent["runtime_status_json"])
+                agent["runtime_status"] = fast_json.loads(agent["runtime_status_json"])
             except Exception:
                 agent["runtime_status"] = {}
         else:
             agent["runtime_status"] = {}
         return agent
 
+    def decode_agent_config(self, agent):
+        """Return the parsed config_json of an agent row.
+
+        Parsed configs are cached per node and reused while the stored text
+        is unchanged, so heartbeats don't re-parse the same JSON every time.
+        The returned dict is shared: copy it before mutating. Invalid JSON
+        raises ``json.JSONDecodeError``.
+        """
+        config_str = agent.get("config_json")
+        if not config_str:
+            return {}
+        node_id = agent.get("node_id")
+        cached = self._config_cache.get(node_id)
+        if cached is not None and cached[0] == config_str:
+            return cached[1]
+        parsed = fast_json.loads(config_str)
+        self._config_cache[node_id] = (config_str, parsed)
+        return parsed
+
     async def register_agent(self, node_id, name="Unknown Agent", ip="0.0.0.0", config=None, runtime_status=None):
+        self._config_cache.pop(node_id, None)
         pool = await self._ensure_pool()
         now = datetime.now().isoformat()
         if config is None:
@@ -159,8 +209,8 @@ class PostgresServerDB:
                 or f"http://localhost:{os.environ.get('SERVER_PORT', '8000').strip() or '8000'}",
                 "deployments": [],
             }
-        config_str = json.dumps(config)
-        runtime_status_str = json.dumps(runtime_status or {})
+        config_str = fast_json.dumps(config)
+        runtime_status_str = fast_json.dumps(runtime_status or {})
 
         async with pool.acquire() as conn:
             async with conn.transaction():
@@ -175,8 +225,8 @@ class PostgresServerDB:
                 await conn.execute(
                     """
                     INSERT INTO agents
-                        (node_id, name, ip, last_heartbeat, status, config_json, is_active, runtime_status_json, whitelist_json)
-                    VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9)
+                        (node_id, name, ip, last_heartbeat, status, config_json, is_active, runtime_status_json, whitelist_json, original_id)
+                    VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9,$10)
                     ON CONFLICT (node_id) DO UPDATE SET
                         name = EXCLUDED.name,
                         ip = EXCLUDED.ip,
@@ -185,7 +235,8 @@ class PostgresServerDB:
                         config_json = EXCLUDED.config_json,
                         is_active = EXCLUDED.is_active,
                         runtime_status_json = EXCLUDED.runtime_status_json,
-                        whitelist_json = EXCLUDED.whitelist_json
+                        whitelist_json = EXCLUDED.whitelist_json,
+                        original_id = EXCLUDED.original_id
                     """,
                     node_id,
                     name,
@@ -196,14 +247,15 @@ class PostgresServerDB:
                     is_active,
                     runtime_status_str,
                     whitelist_json,
+                    self._original_id(config),
                 )
         return config
 
     async def update_heartbeat(self, node_id, ip=None, name=None, runtime_status=None):
         pool = await self._ensure_pool()
         now = datetime.now().isoformat()
-        runtime_status_str = json.dumps(runtime_status or {})
-        result = await pool.execute(
+        runtime_status_str = fast_json.dumps(runtime_status or {})
+        row = await pool.fetchrow(
             """
             UPDATE agents
             SET last_heartbeat = $1,
@@ -212,6 +264,7 @@ class PostgresServerDB:
                 name = COALESCE($4, name),
                 runtime_status_json = $5
             WHERE node_id = $6
+            RETURNING *
             """,
             now,
             "Online",
@@ -220,13 +273,20 @@ class PostgresServerDB:
             runtime_status_str,
             node_id,
         )
-        return not result.endswith(" 0")
+        return self._decode_agent_row(row) if row else None
 
     async def get_agent(self, node_id):
         pool = await self._ensure_pool()
         row = await pool.fetchrow("SELECT * FROM agents WHERE node_id = $1", node_id)
         return self._decode_agent_row(row) if row else None
 
+    async def get_agent_by_original_id(self, original_id):
+        pool = await self._ensure_pool()
+        row = await pool.fetchrow(
+            "SELECT * FROM agents WHERE original_id = $1 ORDER BY node_id LIMIT 1", original_id
+        )
+        return self._decode_agent_row(row) if row else None
+
     async def get_all_agents(self):
         pool = await self._ensure_pool()
         rows = await pool.fetch("SELECT * FROM agents ORDER BY node_id")
@@ -245,19 +305,31 @@ class PostgresServerDB:
         return agents
 
     async def update_agent_config(self, node_id, config_dict, name=None):
+        """Store an agent's config. ``config_dict`` becomes the cached parsed
+        config for the node, so callers must not mutate it afterwards."""
         pool = await self._ensure_pool()
-        config_str = json.dumps(config_dict)
+        config_str = fast_json.dumps(config_dict)
+        original_id = self._original_id(config_dict)
         if name:
             await pool.execute(
-                "UPDATE agents SET config_json = $1, name = $2 WHERE node_id = $3",
+                "UPDATE agents SET config_json = $1, original_id = $2, name = $3 WHERE node_id = $4",
                 config_str,
+                original_id,
                 name,
                 node_id,
             )
         else:
-            await pool.execute("UPDATE agents SET config_json = $1 WHERE node_id = $2", config_str, node_id)
+            await pool.execute(
+                "UPDATE agents SET config_json = $1, original_id = $2 WHERE node_id = $3",
+                config_str,
+                original_id,
+                node_id,
+            )
+        self._config_cache[node_id] = (config_str, config_dict)
 
     async def rename_agent(self, old_node_id, new_node_id):
+        self._config_cache.pop(old_node_id, None)
+        self._config_cache.pop(new_node_id, None)
         pool = await self._ensure_pool()
         async with pool.acquire() as conn:
             async with conn.transaction():
@@ -270,6 +342,7 @@ class PostgresServerDB:
         return True, "Renamed successfully"
 
     async def delete_agent(self, node_id):
+        self._config_cache.pop(node_id, None)
         pool = await self._ensure_pool()
         async with pool.acquire() as conn:
             async with conn.transaction():
@@ -286,7 +359,7 @@ class PostgresServerDB:
         whitelist_json = await pool.fetchval("SELECT whitelist_json FROM agents WHERE node_id = $1", node_id)
         if whitelist_json:
             try:
-                return json.loads(whitelist_json)
+                return fast_json.loads(whitelist_json)
             except (json.JSONDecodeError, TypeError):
                 pass
         return None
@@ -295,18 +368,21 @@ class PostgresServerDB:
         pool = await self._ensure_pool()
         await pool.execute(
             "UPDATE agents SET whitelist_json = $1 WHERE node_id = $2",
-            json.dumps(whitelist_dict, ensure_ascii=False),
+            fast_json.dumps(whitelist_dict),
             node_id,
         )
 
-    async def _log_to_json_file(self, log_entry):
+    async def _log_to_json_file(self, log_entries):
+        if not log_entries:
+            return
         try:
             log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
             os.makedirs(log_dir, exist_ok=True)
             date_str = datetime.now().strftime("%Y-%m-%d")
             log_file = os.path.join(log_dir, f"honeypot-{date_str}.json")
+            payload = "".join(fast_json.dumps(entry) + "\n" for entry in log_entries)
             async with aiofiles.open(log_file, "a") as f:
-                await f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+                await f.write(payload)
         except Exception as e:
             print(f"JSON Logging Error: {e}")
 
@@ -318,7 +394,7 @@ class PostgresServerDB:
             if meta in ("None", "null", ""):
                 return {}
             try:
-                parsed = json.loads(meta)
+                parsed = fast_json.loads(meta)
                 return parsed if isinstance(parsed, dict) else {"raw": meta}
             except (json.JSONDecodeError, ValueError):
                 return {"raw": meta}
@@ -498,19 +574,21 @@ class PostgresServerDB:
     async def insert_logs(self, node_id, logs):
         pool = await self._ensure_pool()
         rows = []
+        elk_entries = []
+        now_iso = datetime.now().isoformat()
         for log in logs:
-            timestamp = log.get("timestamp") or datetime.now().isoformat()
+            timestamp = log.get("timestamp") or now_iso
             attacker_ip = log.get("attacker_ip")
             protocol = log.get("protocol")
             req = log.get("request_data")
             resp = log.get("response_data")
             meta_dict = self._parse_metadata(log.get("metadata"))
-            await self._log_to_json_file(self._build_elk_entry(node_id, timestamp, attacker_ip, protocol, req, resp, meta_dict))
+            elk_entries.append(self._build_elk_entry(node_id, timestamp, attacker_ip, protocol, req, resp, meta_dict))
             if isinstance(req, (dict, list)):
-                req = json.dumps(req)
+                req = fast_json.dumps(req)
             if isinstance(resp, (dict, list)):
-                resp = json.dumps(resp)
-            rows.append((timestamp, node_id, protocol, attacker_ip, req, resp, json.dumps(meta_dict, ensure_ascii=False)))
+                resp = fast_json.dumps(resp)
+            rows.append((timestamp, node_id, protocol, attacker_ip, req, resp, fast_json.dumps(meta_dict)))
         if not rows:
             return 0
         sql = """
@@ -530,6 +608,7 @@ class PostgresServerDB:
                 async with conn.transaction():
                     await conn.executemany(sql, rows)
                     await self._upsert_ip_log_summaries(conn, rows)
+        await self._log_to_json_file(elk_entries)
         return len(rows)
 
     @staticmethod
@@ -592,18 +671,26 @@ class PostgresServerDB:
         pool = await self._ensure_pool()
         await pool.execute("DELETE FROM logs WHERE node_id = $1", node_id)
 
+    async def prune_logs(self, keep_days):
+        """Delete logs older than ``keep_days`` days. Returns rows deleted."""
+        pool = await self._ensure_pool()
+        cutoff = (datetime.now() - timedelta(days=keep_days)).isoformat()
+        result = await pool.execute("DELETE FROM logs WHERE timestamp < $1", cutoff)
+        return int(result.split()[-1])
+
     async def insert_whitelist_logs(self, node_id, logs):
         pool = await self._ensure_pool()
         rows = []
+        now_iso = datetime.now().isoformat()
         for log in logs:
-            timestamp = log.get("timestamp") or datetime.now().isoformat()
+            timestamp = log.get("timestamp") or now_iso
             req = log.get("request_data")
             resp = log.get("response_data")
             meta_dict = self._parse_metadata(log.get("metadata"))
             if isinstance(req, (dict, list)):
-                req = json.dumps(req)
+                req = fast_json.dumps(req)
             if isinstance(resp, (dict, list)):
-                resp = json.dumps(resp)
+                resp = fast_json.dumps(resp)
             rows.append((
                 timestamp,
                 node_id,
@@ -611,7 +698,7 @@ class PostgresServerDB:
                 log.get("attacker_ip"),
                 req,
                 resp,
-                json.dumps(meta_dict, ensure_ascii=False),
+                fast_json.dumps(meta_dict),
             ))
         if not rows:
             return 0
@@ -859,7 +946,7 @@ class PostgresServerDB:
                     alert.get("dst_port") or 0,
                     alert.get("log_id"),
                     alert.get("source") or "internal",
-                    json.dumps(alert.get("metadata") or {}, ensure_ascii=False),
+                    fast_json.dumps(alert.get("metadata") or {}),
                 )
                 if row is not None:
                     await self._upsert_ip_alert_summary(conn, alert)